@@ -9,6 +9,7 @@ collect.py
 
 # 导入python内建模块
 import logging            # 日志模块
+import logging.handlers   # 日志队列处理模块
 import os                 # 系统模块
 import shutil             # 文件操作模块
 import time               # 时间模块
@@ -16,14 +17,31 @@ import re                 # 正则模块
 import json               # JSON模块
 import hashlib            # HASH模块
 import argparse           # 命令行参数模块
-
-# 导入python第三方模块，需要安装exifread, pandas(包含numpy, openpyxl), hachoir
+import queue              # 队列模块
+import threading          # 线程模块
+import sqlite3            # SQLite数据库模块
+import pickle             # 序列化模块
+import multiprocessing    # 多进程模块(跨进程日志队列)
+import atexit             # 退出钩子模块(退出前停止日志监听线程)
+from concurrent.futures import ProcessPoolExecutor   # 进程池模块
+
+# 导入python第三方模块，需要安装exifread, pandas(包含numpy, openpyxl), hachoir,
+# pyarrow(Parquet格式输出用，未安装时自动回退XLSX)
 import exifread           # 照片文件EXIF解析模块
 import pandas             # Pandas表格数据分析模块
+import openpyxl           # XLSX文件读写模块
 import hachoir            # 影音文件元数据解析模块
 from tqdm    import tqdm  # 进度条模块
-from hachoir import metadata   
+from hachoir import metadata
 from hachoir import parser
+try:
+    import xlsxwriter     # XLSX流式写入模块(可选，constant_memory模式更快更省内存)
+except ImportError:
+    xlsxwriter = None
+try:
+    import pyarrow        # Parquet读写引擎(可选，默认输出格式需要)
+except ImportError:
+    pyarrow = None
 
 # 定义媒体文件类别
 _FILE_TYPE = ['image', 'video', 'other']
@@ -47,202 +65,264 @@ _CHK_TYPE  = ['BOTH', 'META', 'EXIF', 'D_ERR', 'Y_ERR']
 _EXIF_KEYS = ['EXIF DateTimeOriginal', 'EXIF DateTimeDigitized', 'Image DateTime']
 _META_KEYS = ['Date-time original',    'Date-time digitized',    'Creation date' ]
 
-# 定义JSON和XLSX文件路径
-_JSON_PATH = r'ext_type_set.json'
-_XLSX_PATH = r'result_df.xlsx'
+# 定义META标签项对应的hachoir原生访问键，直接取值即可，无需导出为文本再匹配前缀
+_META_HACHOIR_KEYS = [('Date-time original',  'date_time_original' ),
+                      ('Date-time digitized', 'date_time_digitized'),
+                      ('Creation date',       'creation_date'      )]
+
+# 定义JSON和XLSX、Parquet文件路径
+_JSON_PATH    = r'ext_type_set.json'
+_XLSX_PATH    = r'result_df.xlsx'
+_PARQUET_PATH = r'result_df.parquet'
+
+# 预编译日期处理用的正则和转换表，避免在每次调用中重复编译
+_CJK_ASCII_RE = re.compile(r'[\u4E00-\u9FA5A-Za-z]')    # 匹配汉字和英文
+_DATE_RE      = re.compile(r'(\d{4}):(\d{1,2}):(\d{1,2})\s+(\d{1,2}):(\d{1,2}):(\d{1,2})')
+_DATE_TRANS   = str.maketrans('-/', '::')               # 替换-和/为:
 
 # 定义XLSX字段（列名）
 _COLS_SET = ['文件路径', '文件类型', '扩展名', '文件大小', 'MD5值', '日期校验', 'EXIF日期项', 'EXIF原日期', 'EXIF短日期', 'EXIF长日期', 'META日期项', 'META原日期', 'META短日期', 'META长日期']
 
+# 严格校验开关，由命令行参数--strict-check设置
+strict_check = False
+
+# 定义解析结果缓存数据库路径，按(路径,修改时间,大小)缓存解析记录，重复运行时未变动的文件直接取缓存
+_CACHE_DB_PATH = os.path.join(os.path.expanduser('~'), '.mrtidy', 'cache.db')
+_cache_conn = None        # 每个进程惰性建立自己的数据库连接
+
 # 初始化日志模块，建立3个日志器，2个文件日志，1个命令行日志。
 _LOG_NAME       = 'Collect'
 _DEBUG_LOG_PATH = r'logs\Collect_Debug.log'
 _ERROR_LOG_PATH = r'logs\Collect_Error.log'
 logger = logging.getLogger(_LOG_NAME)
-logger.setLevel(logging.DEBUG)
-fh_debug = logging.FileHandler(_DEBUG_LOG_PATH, encoding="utf-8")
-fh_error = logging.FileHandler(_ERROR_LOG_PATH, encoding="utf-8")
-ch       = logging.StreamHandler()
-fh_debug.setLevel(logging.DEBUG)
-fh_error.setLevel(logging.ERROR)
-ch.setLevel(logging.INFO)
-formatter = logging.Formatter(
-    fmt="[%(asctime)s] [%(levelname)s] [%(funcName)s]:\n%(message)s",
-    datefmt="%Y/%m/%d %X"
-    )
-fh_debug.setFormatter(formatter)
-fh_error.setFormatter(formatter)
-ch.setFormatter(formatter)
-logger.addHandler(fh_debug)
-logger.addHandler(fh_error)
-logger.addHandler(ch)
-
-
-def process_datetime(raw_datetime):
+_log_queue = None         # 跨进程共享的日志队列，所有记录由主进程的监听线程统一落盘
+
+
+def _init_logger(log_queue=None):
+    '''
+    该函数初始化日志模块:未传入队列时建立3个处理器并启动后台QueueListener
+    记录经QueueHandler入队后由QueueListener分发，热循环中只需一次入队
+    参数    log_queue:   工作进程传入主进程的共享日志队列，不建立本进程的监听线程
+    '''
+    global _log_queue
+    if logger.handlers:
+        return
+    logger.setLevel(logging.DEBUG)
+    if log_queue is None:
+        fh_debug = logging.FileHandler(_DEBUG_LOG_PATH, encoding="utf-8")
+        fh_error = logging.FileHandler(_ERROR_LOG_PATH, encoding="utf-8")
+        ch       = logging.StreamHandler()
+        fh_debug.setLevel(logging.DEBUG)
+        fh_error.setLevel(logging.ERROR)
+        ch.setLevel(logging.INFO)
+        formatter = logging.Formatter(
+            fmt="[%(asctime)s] [%(levelname)s] [%(funcName)s]:\n%(message)s",
+            datefmt="%Y/%m/%d %X"
+            )
+        fh_debug.setFormatter(formatter)
+        fh_error.setFormatter(formatter)
+        ch.setFormatter(formatter)
+        # 队列必须跨进程:工作进程fork后监听线程不复存在，queue.Queue只会越积越多
+        log_queue = multiprocessing.Queue(-1)
+        listener  = logging.handlers.QueueListener(log_queue, fh_debug, fh_error, ch,
+                                                   respect_handler_level=True)
+        listener.start()
+        # 解释器退出时停止监听线程，否则其get()会在队列管道关闭后抛异常
+        atexit.register(listener.stop)
+    _log_queue = log_queue
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+
+_init_logger()
+
+
+def _parse_fixed(datetime):
+    '''
+    此函数按固定宽度直接解析规范的"YYYY:MM:DD HH:MM:SS"(19字节)字符串
+    对每个数字位做一次算术折叠，替代正则匹配加6次int()调用；格式不符时返回None回退正则
+    参数    datetime:    清洗后的日期时间（字符串）
+    返回值               (年,月,日,时,分,秒)整数元组，格式不符为None
+    '''
+    try:
+        buf = datetime.encode('ascii')
+    except UnicodeEncodeError:
+        return None
+    if len(buf) != 19 or buf[4] != 58 or buf[7] != 58 or buf[10] != 32 \
+            or buf[13] != 58 or buf[16] != 58:       # 58=':' 32=' '
+        return None
+    digits = [c - 48 for c in buf]                   # 48='0'
+    for i in (0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18):
+        if not 0 <= digits[i] <= 9:
+            return None
+    return (digits[0]*1000 + digits[1]*100 + digits[2]*10 + digits[3],
+            digits[5]*10   + digits[6],
+            digits[8]*10   + digits[9],
+            digits[11]*10  + digits[12],
+            digits[14]*10  + digits[15],
+            digits[17]*10  + digits[18])
+
+
+def parse_datetime(raw_datetime):
     '''
     此函数对原日期时间进行统一格式和自动修正，返回结果
     参数    raw_datetime:     原日期时间（字符串）
-    返回值  datetime:         处理后的日期时间（字符串）
+    返回值  datetime:         处理后的日期时间，(年,月,日,时,分,秒)整数元组
     '''
-    datetime = re.sub(r'[\u4E00-\u9FA5A-Za-z]', '', raw_datetime)   # 去掉汉字和英文
-    datetime = datetime.replace('-',':')                            # 替换-为:
-    datetime = datetime.replace('/',':')                            # 替换/为:
-    # datetime = datetime[:19]                                      # 保留前19个字符
-    try:
-        datetime = re.search(r'.*(?P<year>\d{4}):(?P<month>\d{1,2}):(?P<day>\d{1,2})\s+(?P<hour>\d{1,2}):(?P<minute>\d{1,2}):(?P<second>\d{1,2}).*', datetime)  # 按"year:month:day hour:minute:second"分组提取日期
-    except Exception as e:
-        logger.error(f'正则匹配错误:{e}')
-        return None    
-    # if not datetime:
-    #     return None
-    # print(datetime.groupdict())
-    year   = int(datetime.group('year'))
-    month  = int(datetime.group('month'))
-    day    = int(datetime.group('day'))
-    hour   = int(datetime.group('hour'))
-    minute = int(datetime.group('minute'))
-    second = int(datetime.group('second'))
-    if year < 1900 or year > 2050:
-        logger.debug(f'解析到的年:{year}错误, 解析失败')
+    datetime = _CJK_ASCII_RE.sub('', raw_datetime)                  # 去掉汉字和英文
+    datetime = datetime.translate(_DATE_TRANS)                      # 单次扫描替换-和/为:
+    parsed = _parse_fixed(datetime.strip())                         # 规范格式走固定宽度快速路径
+    if parsed is None:
+        datetime = _DATE_RE.search(datetime)                        # 按"year:month:day hour:minute:second"分组提取日期
+        if not datetime:
+            return None
+        parsed = map(int, datetime.groups())
+    year, month, day, hour, minute, second = parsed
+    # 常见情况是全部字段合法，先做一次合并判断，合法则直接返回，不合法才逐项定位
+    if 1900 <= year <= 2050 and 1 <= month <= 12 and 1 <= day <= 31 \
+            and hour <= 23 and minute <= 59 and second <= 59:
+        return (year, month, day, hour, minute, second)
+    if not 1900 <= year <= 2050:
+        logger.debug('解析到的年:%s错误, 解析失败', year)
         return None
-    if month < 1 or month > 12:
-        logger.debug(f'解析到的月:{month}错误, 解析失败')
+    if not 1 <= month <= 12:
+        logger.debug('解析到的月:%s错误, 解析失败', month)
         return None
-    if day < 1 or day > 31:
-        logger.debug(f'解析到的日:{day}错误, 解析失败')
+    if not 1 <= day <= 31:
+        logger.debug('解析到的日:%s错误, 解析失败', day)
         return None
-    if hour < 0 or hour > 23:
-        logger.debug(f'解析到的时:{hour}错误, 自动修复')
-        hour = hour % 24 
-    if minute < 0 or minute > 59:
-        logger.debug(f'解析到的分:{minute}错误, 自动修复')
+    if hour > 23:
+        logger.debug('解析到的时:%s错误, 自动修复', hour)
+        hour = hour % 24
+    if minute > 59:
+        logger.debug('解析到的分:%s错误, 自动修复', minute)
         minute = minute % 60
-    if second < 0 or second > 59:
-        logger.debug(f'解析到的秒:{second}错误, 自动修复')
+    if second > 59:
+        logger.debug('解析到的秒:%s错误, 自动修复', second)
         second = second % 60
-    datetime = f"{year}:{month:02}:{day:02} {hour:02}:{minute:02}:{second:02}"
-    return datetime
+    return (year, month, day, hour, minute, second)
 
 
-def get_exif_datetime(file, tag_keys=_EXIF_KEYS):
+def _new_datetime_msg(msg_type):
+    '''
+    此函数初始化EXIF/META解析结果msg，返回字典
+    参数    msg_type:  解析类型，EXIF或META
+    返回值  msg:       初始化的解析结果，字典格式
     '''
-    此函数解析媒体文件的EXIF标签，返回解析结果
+    msg = {}
+    msg['stat']  = '1'       # 解析状态 0:成功 1:无法解析文件 2:无标签 3:标签无日期项 4:日期项数据错误
+    msg['type']  = msg_type  # 解析类型
+    msg['key']   = None      # 提取的标签项字段名
+    msg['raw']   = None      # 提取到的原日期时间，如2022-04-01 15:25:38 下午
+    msg['short'] = None      # 处理后的短日期时间，如2022/04
+    msg['long']  = None      # 处理后的长日期时间，如20220401_152538
+    return msg
+
+
+def _fill_datetime_msg(msg, datetime_key, raw_datetime):
+    '''
+    此函数解析提取到的原日期时间并填入msg，返回是否填入成功
+    参数    msg:           _new_datetime_msg初始化的解析结果字典
+    参数    datetime_key:  提取到的标签项字段名
+    参数    raw_datetime:  提取到的原日期时间
+    返回值                 日期合法并填入成功为True
+    '''
+    pro_datetime = parse_datetime(raw_datetime)
+    if not pro_datetime:
+        return False
+    y, mo, d, h, mi, s = pro_datetime      # parse_datetime已做范围检验，直接格式化
+    msg['stat']  = '0'
+    msg['key']   = datetime_key
+    msg['raw']   = raw_datetime
+    msg['short'] = f'{y}/{mo:02}'
+    msg['long']  = f'{y}{mo:02}{d:02}_{h:02}{mi:02}{s:02}'
+    return True
+
+
+def get_exif_datetime(file):
+    '''
+    此函数解析媒体文件的EXIF标签，按_EXIF_KEYS优先级提取日期项，返回解析结果
     参数    file:      需要解析的媒体文件
-    参数    tag_keys:  需要提取的EXIF标签项序列
     返回值  msg:       解析结果，字典格式
     '''
-    msg = {}               # 初始化msg
-    msg['stat']  = '1'     # 解析状态 0:成功 1:无法解析文件 2:无EXIF标签 3:EXIF标签无日期项 4:日期项数据错误
-    msg['type']  = 'EXIF'  # 解析类型
-    msg['key']   = None    # 提取的标签项字段名
-    msg['raw']   = None    # 提取到的原日期时间，如2022-04-01 15:25:38 下午
-    msg['short'] = None    # 处理后的短日期时间，如2022/04
-    msg['long']  = None    # 处理后的长日期时间，如20220401_152538
+    msg = _new_datetime_msg('EXIF')
     try:
-        logger.debug(f'开始解析EXIF标签:{file}')
-        f = open(file, 'rb')
-        exif_tags = exifread.process_file(f)
+        logger.debug('开始解析EXIF标签:%s', file)
+        # 只需要DateTime系标签，跳过MakerNote细节和缩略图并提前终止解析
+        # 终止标签必须是子IFD里的DateTimeOriginal:用IFD0里的DateTime会在读到
+        # ExifOffset之前停止，导致DateTimeOriginal/DateTimeDigitized永远解析不到
+        with open(file, 'rb') as f:
+            exif_tags = exifread.process_file(f, details=False, stop_tag='DateTimeOriginal',
+                                              extract_thumbnail=False)
     except Exception as e:
-        logger.error(f'解析EXIF失败，文件无法解析:{e}')
+        logger.error('解析EXIF失败，文件无法解析:%s', e)
         return msg
     # 注意:exif_tags是字典
     if exif_tags:
-        # logger.debug(f"解析到EXIF标签项:{exif_tags.keys()}")
-        datetime_key = None
-        for i in range(len(tag_keys)):
-            if tag_keys[i] in exif_tags:
-                datetime_key = tag_keys[i]
-                break
+        # logger.debug("解析到EXIF标签项:%s", exif_tags.keys())
+        datetime_key = next((key for key in _EXIF_KEYS if key in exif_tags), None)
         if datetime_key:
             raw_datetime = exif_tags.get(datetime_key).values
-            logger.debug(f'EXIF初值: {raw_datetime}')
-            pro_datetime = process_datetime(raw_datetime)
-            if pro_datetime:
-                datetime = time.strptime(pro_datetime, '%Y:%m:%d %H:%M:%S')      # 通过time模块二次检验和过滤格式
-                logger.debug(f'EXIF中值: {datetime}')
-                msg['stat']  = '0'
-                msg['key']   = datetime_key
-                msg['raw']   = raw_datetime
-                msg['short'] = time.strftime('%Y/%m', datetime)
-                msg['long']  = time.strftime('%Y%m%d_%H%M%S', datetime)
-                logger.debug(f"EXIF终值: {msg['short']},{msg['long']}")
+            logger.debug('EXIF初值: %s', raw_datetime)
+            if _fill_datetime_msg(msg, datetime_key, raw_datetime):
+                logger.debug("EXIF终值: %s,%s", msg['short'], msg['long'])
                 return msg
             msg['stat'] = '4'
-            logger.debug(f'解析EXIF失败，EXIF标签中的日期有错误')
+            logger.debug('解析EXIF失败，EXIF标签中的日期有错误')
             return msg
         msg['stat'] = '3'
-        logger.debug(f'解析EXIF失败，EXIF标签中提取不到日期项')
+        logger.debug('解析EXIF失败，EXIF标签中提取不到日期项')
         return msg
     msg['stat'] = '2'
-    logger.debug(f'解析EXIF失败，未解析到EXIF标签')
+    logger.debug('解析EXIF失败，未解析到EXIF标签')
     return msg
 
 
-def get_meta_datetime(file, tag_keys=_META_KEYS):
+def get_meta_datetime(file):
     """
-    此函数解析媒体文件的META标签，返回解析结果
+    此函数解析媒体文件的META标签，按_META_HACHOIR_KEYS优先级提取日期项，返回解析结果
     参数    file:      需要解析的媒体文件
-    参数    tag_keys:  需要提取的META标签项序列
     返回值  msg:       解析结果，字典格式
     """
-    msg = {}               # 初始化msg
-    msg['stat']  = '1'     # 解析状态 0:成功 1:无法解析文件 2:无META标签 3:META标签无日期项 4:日期项数据错误
-    msg['type']  = 'META'  # 解析类型
-    msg['key']   = None    # 提取的标签项字段名
-    msg['raw']   = None    # 提取到的原日期时间，如2022-04-01 15:25:38 下午
-    msg['short'] = None    # 处理后的短日期时间，如2022/04
-    msg['long']  = None    # 处理后的长日期时间，如20220401_152538
+    msg = _new_datetime_msg('META')
     try:
-        logger.debug(f'开始解析META:{file}')
+        logger.debug('开始解析META:%s', file)
         f = parser.createParser(file)
         meta_decode = metadata.extractMetadata(f)
-        meta_tags = meta_decode.exportPlaintext(line_prefix="") # 将文件的metadata转换为list,且将前缀设置为空
     except Exception as e:
-        logger.error(f'解析META失败，文件无法解析:{e}')
+        logger.error('解析META失败，文件无法解析:%s', e)
         return msg
-    # 注意:meta_tags是列表
-    if meta_tags:
-        # logger.debug(f"解析到META标签:{meta_tags}")
+    if meta_decode:
+        # 通过hachoir的原生访问键直接取日期项，避免导出全部标签为文本再逐行匹配
         datetime_key = None
-        key_tag = None
-        for i in range(len(tag_keys)):
-            for tag in meta_tags:
-                if tag.startswith(tag_keys[i]):
-                    datetime_key = tag_keys[i]
-                    key_tag = tag
-                    break
-            else:
-                continue
-            break
-        if datetime_key and key_tag:
-            raw_datetime = key_tag.replace(datetime_key+': ','')
-            logger.debug(f'META初值:{raw_datetime}')
-            pro_datetime = process_datetime(raw_datetime)
-            if pro_datetime:
-                datetime = time.strptime(pro_datetime, '%Y:%m:%d %H:%M:%S')      # 通过time模块二次检验和过滤格式
-                logger.debug(f'META中值: {datetime}')
-                msg['stat']  = '0'
-                msg['key']   = datetime_key
-                msg['raw']   = raw_datetime
-                msg['short'] = time.strftime('%Y/%m', datetime)
-                msg['long']  = time.strftime('%Y%m%d_%H%M%S', datetime)
-                logger.debug(f"META终值: {msg['short']},{msg['long']}")
+        raw_datetime = None
+        for tag_key, hachoir_key in _META_HACHOIR_KEYS:
+            if meta_decode.has(hachoir_key):
+                datetime_key = tag_key
+                raw_datetime = str(meta_decode.get(hachoir_key))
+                break
+        if datetime_key:
+            logger.debug('META初值:%s', raw_datetime)
+            if _fill_datetime_msg(msg, datetime_key, raw_datetime):
+                logger.debug("META终值: %s,%s", msg['short'], msg['long'])
                 return msg
             msg['stat'] = '4'
-            logger.debug(f'解析META失败，META标签中的日期有错误')
+            logger.debug('解析META失败，META标签中的日期有错误')
             return msg
         msg['stat'] = '3'
-        logger.debug(f'解析META失败，META标签中提取不到日期项')
+        logger.debug('解析META失败，META标签中提取不到日期项')
         return msg
     msg['stat'] = '2'
-    logger.debug(f'解析META失败，未解析到META标签')
+    logger.debug('解析META失败，未解析到META标签')
     return msg
 
 
-def get_datetime(file, begin_year=2000):
+def get_datetime(file, file_type, begin_year=2000, strict=False):
     """
     此函数读取文件的EXIF和META信息，返回解析结果msg
     参数    file:         需要解析解析文件
+    参数    file_type:    文件类型，image或video
+    参数    begin_year:   初始年份，早于该年份判为Y_ERR，默认为2000年
+    参数    strict:       是否强制同时解析EXIF和META并互相校验，默认关闭
     返回值  msg:          解析的信息结果，字典格式
     """
     msg = {}                # 初始化msg
@@ -256,12 +336,24 @@ def get_datetime(file, begin_year=2000):
     msg['META_R'] = None    # META处理前的原日期
     msg['META_S'] = None    # META处理后的短日期
     msg['META_L'] = None    # META处理后的长日期
-    logger.info(f'开始解析{file}')
-    exif_dt = get_exif_datetime(file)
-    meta_dt = get_meta_datetime(file)
+    logger.info('开始解析%s', file)
+    # EXIF对MP4/MOV无意义，META对已有EXIF日期的照片冗余，按文件类型跳过已知无效的解析
+    # image以EXIF优先，EXIF失败才回退META; video只解析META; strict时强制两者都解析并互相校验
+    if strict:
+        exif_dt = get_exif_datetime(file)
+        meta_dt = get_meta_datetime(file)
+    elif file_type == 'video':
+        exif_dt = _new_datetime_msg('EXIF')
+        meta_dt = get_meta_datetime(file)
+    else:
+        exif_dt = get_exif_datetime(file)
+        if exif_dt['stat'] == '0':
+            meta_dt = _new_datetime_msg('META')
+        else:
+            meta_dt = get_meta_datetime(file)
     # 优先采用exif_dt信息
     if exif_dt['stat'] == '0':
-        logger.debug(f'解析到文件{file}的EXIF日期信息{exif_dt}')
+        logger.debug('解析到文件%s的EXIF日期信息%s', file, exif_dt)
         msg['stat']   = '0'
         msg['EXIF_K'] = exif_dt['key']
         msg['EXIF_R'] = exif_dt['raw']
@@ -269,7 +361,7 @@ def get_datetime(file, begin_year=2000):
         msg['EXIF_L'] = exif_dt['long']
         the_year = int(msg['EXIF_S'].split('/')[0])
     if meta_dt['stat'] == '0':
-        logger.debug(f'解析到文件{file}的META日期信息{meta_dt}')
+        logger.debug('解析到文件%s的META日期信息%s', file, meta_dt)
         msg['stat']   = '0'
         msg['META_K'] = meta_dt['key']
         msg['META_R'] = meta_dt['raw']
@@ -291,198 +383,407 @@ def get_datetime(file, begin_year=2000):
             if the_year < begin_year or the_year > time.localtime().tm_year:
                 msg['check'] = 'Y_ERR'
     else:
-        logger.debug(f'文件:{file}无日期信息')
-    logger.info(f'解析结果:{msg}')
+        logger.debug('文件:%s无日期信息', file)
+    logger.info('解析结果:%s', msg)
     return msg
 
 
-def get_file_size(file, unit='KB'):
+def iter_files(directory):
     """
-    此函数获取文件的大小
-    参数:    file:         需要解析解析文件
-    返回值:               文件大小，默认单位KB，保留小数点后2位
+    此函数用os.scandir递归遍历目录，逐个返回(文件路径, 文件大小, 文件修改时间)
+    DirEntry.stat()复用遍历时缓存的结果，每个文件只需一次stat且只需遍历一次目录树
+    参数:    directory:    需要遍历的目录路径
+    """
+    for entry in os.scandir(directory):
+        if entry.is_dir(follow_symlinks=False):
+            yield from iter_files(entry.path)
+        elif entry.is_file(follow_symlinks=False):
+            stat = entry.stat()
+            yield entry.path, stat.st_size, stat.st_mtime_ns
+
+
+# 超过该大小的文件用读取/哈希双线程流水线计算HASH
+_OVERLAP_SIZE = 8 * 1024 * 1024
+
+
+def _hash_file_overlapped(f, f_hash):
+    '''
+    此函数用读取线程+双缓冲流水线计算文件HASH，让磁盘读取和哈希计算重叠
+    hashlib在更新>=2048字节的数据时会释放GIL，读取与哈希可以真正并行
+    参数    f:       已打开的文件对象(二进制)
+    参数    f_hash:  hashlib的hash对象
+    返回值  f_hash:  更新完毕的hash对象
+    '''
+    free_bufs = queue.Queue()
+    full_bufs = queue.Queue()
+    for i in range(2):
+        free_bufs.put(bytearray(1 << 20))
+
+    def _reader():
+        # 读取异常也必须入队，否则主线程会在full_bufs.get()上永久阻塞
+        try:
+            while True:
+                buf = free_bufs.get()
+                n = f.readinto(buf)
+                full_bufs.put((buf, n))
+                if not n:
+                    return
+        except Exception as e:
+            full_bufs.put((None, e))
+
+    reader = threading.Thread(target=_reader, daemon=True)
+    reader.start()
+    while True:
+        buf, n = full_bufs.get()
+        if buf is None:
+            reader.join()
+            raise n
+        if not n:
+            break
+        f_hash.update(memoryview(buf)[:n])
+        free_bufs.put(buf)
+    reader.join()
+    return f_hash
+
+
+def get_file_md5(file, algo='md5'):
+    """
+    此函数获取文件的HASH，返回hash值
+    参数    file:         需要解析解析文件
+    参数    algo:         hash算法，默认md5，可选sha256(在支持SHA-NI指令的CPU上更快)
     """
     if not os.path.isfile(file):
-        logger.error(f'文件不存在, 无法获取大小:{file}')
+        logger.error('文件不存在, 无法获取HASH:%s', file)
         return None
-    f_size = os.path.getsize(file)
-    f_KB   = round(f_size/float(1024), 2)
-    f_MB   = round(f_size/float(1024**2),2)
-    if unit == 'MB':
-        return f_MB
-    return f_KB
+    try:
+        # buffering=0避免双重缓冲，读取和更新hash的循环在C层完成
+        with open(file, 'rb', buffering=0) as f:
+            if os.fstat(f.fileno()).st_size > _OVERLAP_SIZE:
+                return _hash_file_overlapped(f, hashlib.new(algo)).hexdigest()
+            if hasattr(hashlib, 'file_digest'):          # Py>=3.11
+                return hashlib.file_digest(f, algo).hexdigest()
+            # Py<3.11回退:1MiB缓冲区+readinto零拷贝循环
+            f_hash = hashlib.new(algo)
+            buf = memoryview(bytearray(1 << 20))
+            n = f.readinto(buf)
+            while n:
+                f_hash.update(buf[:n])
+                n = f.readinto(buf)
+            return f_hash.hexdigest()
+    except Exception as e:
+        logger.error('%s', e)
+        return None
+
+
+# Windows没有os.pread，回退为同一fd上lseek+read读取首尾两段
+_HAS_PREAD = hasattr(os, 'pread')
 
 
-def get_file_md5(file):
+def get_file_sig(file):
     """
-    此函数获取文件的MD5，返回hash值
+    此函数获取文件的快速指纹(文件大小+首尾各64KiB的MD5)，返回hash值
+    与全文件MD5相比只读取最多128KiB，大文件上可减少几个数量级的读取量，
+    指纹碰撞的文件组由main在收集完成后二次计算全文件MD5确认
     参数    file:         需要解析解析文件
     """
     if not os.path.isfile(file):
-        logger.error(f'文件不存在, 无法获取HASH:{file}')
+        logger.error('文件不存在, 无法获取HASH:%s', file)
         return None
-    f_md5 = hashlib.md5()
     try:
-        f = open(file, 'rb')
-        while True:
-            b = f.read(8096)
-            if not b:
-                break
-            f_md5.update(b)
-        f.close()
+        fd = os.open(file, os.O_RDONLY)
+        try:
+            f_size = os.fstat(fd).st_size
+            f_hash = hashlib.md5(f_size.to_bytes(8, 'little'))
+            if _HAS_PREAD:
+                f_hash.update(os.pread(fd, 65536, 0))
+                if f_size > 65536:
+                    f_hash.update(os.pread(fd, 65536, f_size - 65536))
+            else:
+                f_hash.update(os.read(fd, 65536))
+                if f_size > 65536:
+                    os.lseek(fd, f_size - 65536, os.SEEK_SET)
+                    f_hash.update(os.read(fd, 65536))
+        finally:
+            os.close(fd)
+        return f_hash.hexdigest()
     except Exception as e:
         logger.error('%s', e)
-    return f_md5.hexdigest()
+        return None
 
 
-def process_files(root, files):
+def resolve_sigs(files_datalist):
     '''
-    该函数对文件夹内的所有文件进行解析，返回解析结果result
-    参数    root:     需要解析的文件夹路径
-    参数    files:    该文件夹下的所有文件
-    返回值  result:   所有文件的解析的结果，二维列表格式
+    该函数对指纹相同的文件组二次计算全文件MD5，原地覆盖MD5列
+    参数    files_datalist:   所有文件的解析结果，二维列表格式，字段同_COLS_SET
     '''
-    result = []
-    for file in files:
-        file_path = os.path.join(root, file)
-        file_ext = os.path.splitext(file_path)[1][1:].lower()
-        file_dext = '.' + file_ext
-        # 验证文件分类
-        if file_ext not in ext_type_set.keys():
-            file_type = input(f"{file_ext}属于何种类型:")
-            while file_type not in _FILE_TYPE:
-                print(f"请输入image或video或other")
-                file_type = input(f"{file_ext}属于何种类型:")
-            ext_type_set[file_ext] = file_type
-            logger.debug(f'添加扩展名{file_ext}到{file_type}类型')
-        file_type = ext_type_set[file_ext]
-        file_size = get_file_size(file_path)
-        file_md5  = get_file_md5(file_path)
-        dt_stat       = None
-        dt_check      = None
-        dt_exif_raw   = None
-        dt_exif_long  = None
-        dt_exif_short = None
-        dt_meta_raw   = None
-        dt_meta_long  = None
-        dt_meta_short = None
-        if file_type == 'image' or file_type == 'video' :
-            file_dtl = get_datetime(file_path)
-            # logger.debug(f'文件:{file}已解析,结果为{file_dtl}')
-            if file_dtl:
-                dt_stat       = file_dtl['stat']
-                dt_check      = file_dtl['check']
-                dt_exif_key   = file_dtl['EXIF_K']
-                dt_exif_raw   = file_dtl['EXIF_R']
-                dt_exif_long  = file_dtl['EXIF_L']
-                dt_exif_short = file_dtl['EXIF_S']
-                dt_meta_key   = file_dtl['META_K']
-                dt_meta_raw   = file_dtl['META_R']
-                dt_meta_long  = file_dtl['META_L']
-                dt_meta_short = file_dtl['META_S']
-        file_datalist = [file_path, file_type, file_ext, file_size, file_md5, dt_check, dt_exif_key, dt_exif_raw, dt_exif_short, dt_exif_long, dt_meta_key, dt_meta_raw, dt_meta_short, dt_meta_long]
-        result.append(file_datalist)
-    return result
+    sig_groups = {}
+    for row in files_datalist:
+        sig_groups.setdefault(row[4], []).append(row)
+    for sig, rows in sig_groups.items():
+        if sig and len(rows) > 1:
+            logger.debug('指纹%s对应%s个文件, 二次计算全文件MD5', sig, len(rows))
+            for row in rows:
+                row[4] = get_file_md5(row[0])
+
+
+def classify_ext(file_ext):
+    '''
+    该函数对未知的扩展名进行交互式分类，返回文件类型
+    参数    file_ext:     需要分类的扩展名
+    返回值  file_type:    用户确认的文件类型
+    '''
+    file_type = input(f"{file_ext}属于何种类型:")
+    while file_type not in _FILE_TYPE:
+        print(f"请输入image或video或other")
+        file_type = input(f"{file_ext}属于何种类型:")
+    return file_type
+
+
+def _init_worker(type_set, strict, log_queue):
+    '''
+    该函数初始化进程池的工作进程，传入已确认好的扩展名类型字典(只读)和严格校验开关
+    参数    type_set:     已确认好的扩展名类型字典
+    参数    strict:       是否强制同时解析EXIF和META并互相校验
+    参数    log_queue:    主进程的共享日志队列，工作进程的记录经它由主进程落盘
+    '''
+    global ext_type_set, strict_check
+    ext_type_set = type_set
+    strict_check = strict
+    # fork/spawn继承或自建的处理器都换成指向共享队列的QueueHandler
+    logger.handlers.clear()
+    _init_logger(log_queue)
+
+
+def _get_cache_conn():
+    '''
+    该函数惰性建立当前进程的缓存数据库连接，返回连接对象
+    WAL模式允许多个工作进程并发读写
+    '''
+    global _cache_conn
+    if _cache_conn is None:
+        os.makedirs(os.path.dirname(_CACHE_DB_PATH), exist_ok=True)
+        _cache_conn = sqlite3.connect(_CACHE_DB_PATH, isolation_level=None)
+        _cache_conn.execute('PRAGMA journal_mode=WAL')
+        _cache_conn.execute('PRAGMA synchronous=NORMAL')
+        # 旧版缓存表没有strict列，直接重建(缓存可随时重算，无需迁移数据)
+        cache_cols = [col[1] for col in _cache_conn.execute('PRAGMA table_info(f)')]
+        if cache_cols and 'strict' not in cache_cols:
+            _cache_conn.execute('DROP TABLE f')
+        _cache_conn.execute('CREATE TABLE IF NOT EXISTS f('
+                            'path TEXT, strict INTEGER, mtime INTEGER, size INTEGER, row BLOB, '
+                            'PRIMARY KEY(path, strict))')
+    return _cache_conn
+
+
+def _process_one(file_path, file_bytes, file_mtime):
+    '''
+    该函数对单个文件进行解析，返回该文件的一条解析记录
+    命中缓存((路径,修改时间,大小)均未变动)时直接返回缓存的记录，不再解析
+    参数    file_path:       需要解析的文件路径
+    参数    file_bytes:      遍历目录时已取得的文件大小，单位字节
+    参数    file_mtime:      遍历目录时已取得的文件修改时间，单位纳秒
+    返回值  file_datalist:   该文件的解析结果，列表格式，字段同_COLS_SET
+    '''
+    conn = _get_cache_conn()
+    # 缓存键用绝对路径:相对路径随工作目录变化，不同目录下的同名文件会互相串缓存
+    cache_path = os.path.abspath(file_path)
+    # strict模式的解析结果不同(两类标签都解析并互相校验)，缓存键必须区分
+    cached = conn.execute('SELECT row FROM f WHERE path=? AND strict=? AND mtime=? AND size=?',
+                          (cache_path, int(strict_check), file_mtime, file_bytes)).fetchone()
+    if cached:
+        logger.debug('缓存命中:%s', file_path)
+        return pickle.loads(cached[0])
+    file_ext  = os.path.splitext(file_path)[1][1:].lower()
+    file_type = ext_type_set[file_ext]
+    file_size = round(file_bytes / 1024, 2)      # 文件大小，单位KB，保留小数点后2位
+    file_md5  = get_file_sig(file_path)
+    dt_stat       = None
+    dt_check      = None
+    dt_exif_key   = None
+    dt_exif_raw   = None
+    dt_exif_long  = None
+    dt_exif_short = None
+    dt_meta_key   = None
+    dt_meta_raw   = None
+    dt_meta_long  = None
+    dt_meta_short = None
+    if file_type == 'image' or file_type == 'video' :
+        file_dtl = get_datetime(file_path, file_type, strict=strict_check)
+        # logger.debug('文件:%s已解析,结果为%s', file_path, file_dtl)
+        if file_dtl:
+            dt_stat       = file_dtl['stat']
+            dt_check      = file_dtl['check']
+            dt_exif_key   = file_dtl['EXIF_K']
+            dt_exif_raw   = file_dtl['EXIF_R']
+            dt_exif_long  = file_dtl['EXIF_L']
+            dt_exif_short = file_dtl['EXIF_S']
+            dt_meta_key   = file_dtl['META_K']
+            dt_meta_raw   = file_dtl['META_R']
+            dt_meta_long  = file_dtl['META_L']
+            dt_meta_short = file_dtl['META_S']
+    file_datalist = [file_path, file_type, file_ext, file_size, file_md5, dt_check, dt_exif_key, dt_exif_raw, dt_exif_short, dt_exif_long, dt_meta_key, dt_meta_raw, dt_meta_short, dt_meta_long]
+    conn.execute('INSERT OR REPLACE INTO f VALUES(?,?,?,?,?)',
+                 (cache_path, int(strict_check), file_mtime, file_bytes, pickle.dumps(file_datalist)))
+    return file_datalist
+
+
+def write_xlsx(rows, cols, path, sheet_name):
+    '''
+    该函数以openpyxl的write_only模式流式写入XLSX文件，逐行追加
+    行数据直接写入压缩流，不在内存中构建整个工作簿，内存占用与行数无关
+    参数    rows:         需要写入的行数据，可迭代
+    参数    cols:         字段（列首）列表
+    参数    path:         XLSX文件路径
+    参数    sheet_name:   工作表名
+    '''
+    logger.info('开始写入XLSX文件:%s...', path)
+    if xlsxwriter:
+        # constant_memory模式逐行直接序列化到压缩流，不实例化单元格对象，更快且内存恒定
+        workbook  = xlsxwriter.Workbook(path, {'constant_memory': True})
+        worksheet = workbook.add_worksheet(sheet_name)
+        worksheet.write_row(0, 0, cols)
+        for i, row in enumerate(rows, start=1):
+            worksheet.write_row(i, 0, row)
+        workbook.close()
+    else:
+        workbook  = openpyxl.Workbook(write_only=True)
+        worksheet = workbook.create_sheet(sheet_name)
+        worksheet.append(cols)
+        for row in rows:
+            worksheet.append(row)
+        workbook.save(path)
+    logger.info('写入XLSX文件完毕')
 
 
 def count_nums(file_dataframe):
     record = {}
     record['total'] = len(file_dataframe)
+    # 每列只做一次value_counts(C层单遍哈希统计)，避免逐个类别转list再count的重复扫描
+    type_vc = file_dataframe['文件类型'].value_counts()
+    ext_vc  = file_dataframe['扩展名'].value_counts()
+    chk_vc  = file_dataframe['日期校验'].value_counts()
+    exif_vc = file_dataframe['EXIF日期项'].value_counts()
+    meta_vc = file_dataframe['META日期项'].value_counts()
     sp = ''
     print('\n')
     print(     '┌─────────────────────────[解析结果]────────────────────────────┐')
     print(    f"│{sp:<15}共解析文件记录..................{record['total']:>6}条{sp:<8}│")
     print(     '├──────────────────────────文件类型─────────────────────────────┤')
     for file_type in _FILE_TYPE:
-        record[file_type] = list(file_dataframe['文件类型']).count(file_type)
+        record[file_type] = int(type_vc.get(file_type, 0))
         print(f"│{sp:<15}{file_type:<10}文件记录..............{record[file_type]:>6}条{sp:<8}│")
     print(     '├──────────────────────────扩展类型─────────────────────────────┤')
-    for ext in ext_type_set.keys():
-        record[ext]       = list(file_dataframe['扩展名']).count(ext)
+    for ext in ext_type_set:
+        record[ext]       = int(ext_vc.get(ext, 0))
         print(f"│{sp:<15}{ext:<10}文件记录..............{record[ext]:>6}条{sp:<8}│")
     print(     '├──────────────────────────日期解析─────────────────────────────┤')
     for info_type in _CHK_TYPE:
-        record[info_type] = list(file_dataframe['日期校验']).count(info_type)
+        record[info_type] = int(chk_vc.get(info_type, 0))
         print(f"│{sp:<15}{info_type:<10}文件记录..............{record[info_type]:>6}条{sp:<8}│")
     print(     '├──────────────────────────EXIF标签─────────────────────────────┤')
     for exif_key in _EXIF_KEYS:
-        record[exif_key] = list(file_dataframe['EXIF日期项']).count(exif_key)
+        record[exif_key] = int(exif_vc.get(exif_key, 0))
         print(f"│{sp:<2}{exif_key:<23}文件记录..............{record[exif_key]:>6}条{sp:<8}│")
     print(     '├──────────────────────────META标签─────────────────────────────┤')
     for meta_key in _META_KEYS:
-        record[meta_key] = list(file_dataframe['META日期项']).count(meta_key)
+        record[meta_key] = int(meta_vc.get(meta_key, 0))
         print(f"│{sp:<2}{meta_key:<23}文件记录..............{record[meta_key]:>6}条{sp:<8}│")
     print(     '└───────────────────────────────────────────────────────────────┘')
     return record
 
 
-def main(process_directory):
+def main(process_directory, output_fmt='parquet'):
     '''
     主函数
     参数    process_directory:     需要解析的文件夹路径
+    参数    output_fmt:            结果文件输出格式，parquet/xlsx/both，默认parquet
+                                   Parquet为列式存储，字典编码+压缩后比XLSX小几个数量级且读写更快
     '''
     curdir = os.path.abspath(os.curdir)
-    files_total = 0
-    for root, dirs, files in os.walk(process_directory):
-        for each in files:
-            files_total += 1
-    logger.info(f'共发现待解析文件:{files_total}个')
-
-    pbar = tqdm(total=files_total,ncols=80)
-    files_datalist = []
-    for root, dirs, files in os.walk(process_directory):
-        files_updatelist = process_files(root, files)
-        files_datalist += files_updatelist 
-        files_num = len(files_datalist)
-        files_per = files_num / files_total
-        logger.info(f'已完成解析目录:{root}')
-        logger.info(f'已完成解析文件:{files_num}/{files_total}, 完成率:{files_per:.2%}')
-        pbar.update(len(files_updatelist))
-    pbar.close()
+    file_paths  = []
+    file_sizes  = []
+    file_mtimes = []
+    for file_path, file_bytes, file_mtime in iter_files(process_directory):
+        file_paths.append(file_path)
+        file_sizes.append(file_bytes)
+        file_mtimes.append(file_mtime)
+    files_total = len(file_paths)
+    logger.info('共发现待解析文件:%s个', files_total)
+
+    # 预扫描扩展名，在派发任务前一次性交互确认未知类型，保证工作进程中无需交互
+    for file_ext in sorted({os.path.splitext(p)[1][1:].lower() for p in file_paths}):
+        if file_ext not in ext_type_set:
+            file_type = classify_ext(file_ext)
+            ext_type_set[file_ext] = file_type
+            logger.debug('添加扩展名%s到%s类型', file_ext, file_type)
 
+    # 每个文件的解析互相独立，用进程池并行解析，executor.map保证结果顺序
+    with ProcessPoolExecutor(max_workers=os.cpu_count(),
+                             initializer=_init_worker,
+                             initargs=(ext_type_set, strict_check, _log_queue)) as executor:
+        files_datalist = list(tqdm(executor.map(_process_one, file_paths, file_sizes, file_mtimes, chunksize=16),
+                                   total=files_total, ncols=80))
+    logger.info('已完成解析文件:%s/%s个', len(files_datalist), files_total)
+    resolve_sigs(files_datalist)
 
     os.chdir(curdir)
-    file_dataframe = pandas.DataFrame(files_datalist, columns=_COLS_SET)
-    logger.info('开始写入XLSX文件...')
-    file_dataframe.to_excel(_XLSX_PATH, sheet_name='文件解析结果')
-    logger.info('写入XLSX文件完毕')
+    if output_fmt in ('xlsx', 'both'):
+        write_xlsx(files_datalist, _COLS_SET, _XLSX_PATH, '文件解析结果')
+    # 按列(SoA)组装DataFrame用于统计和Parquet输出，避免pandas按行推断dtype再转置；字符串列用string dtype节省内存
+    data_columns = list(zip(*files_datalist)) if files_datalist else [[] for col in _COLS_SET]
+    file_dataframe = pandas.DataFrame(
+        {col: (pandas.Series(arr, dtype='float32') if col == '文件大小'
+               else pandas.array(arr, dtype='string'))
+         for col, arr in zip(_COLS_SET, data_columns)},
+        copy=False)
+    if output_fmt in ('parquet', 'both'):
+        logger.info('开始写入Parquet文件:%s...', _PARQUET_PATH)
+        file_dataframe.to_parquet(_PARQUET_PATH, compression='zstd', index=False)
+        logger.info('写入Parquet文件完毕')
     count_nums(file_dataframe)
 
 
 if __name__ == '__main__':
     arg_parser = argparse.ArgumentParser()
     arg_parser.add_argument("-d", "--dir", help="请填写准备解析的文件目录路径")
+    arg_parser.add_argument("-strict", "--strict-check", help="强制同时解析EXIF和META日期并互相校验", action="store_true")
+    arg_parser.add_argument("-fmt", "--fmt", help="结果文件输出格式", choices=['parquet', 'xlsx', 'both'], default='parquet')
     args = arg_parser.parse_args()
+    strict_check = args.strict_check
+    # 解析可能耗时数小时，缺少pyarrow时必须在启动前回退，不能等写Parquet时才报错
+    if pyarrow is None and args.fmt in ('parquet', 'both'):
+        logger.error('未安装pyarrow，无法输出Parquet格式，已回退XLSX格式')
+        args.fmt = 'xlsx'
 
     print('-------------欢迎使用本程序-------------')
 
     if os.path.exists(_JSON_PATH):
-        logger.debug(f'正在导入JSON文件:{_JSON_PATH}')
+        logger.debug('正在导入JSON文件:%s', _JSON_PATH)
         try:
             with open(_JSON_PATH, 'r') as f:
                 ext_type_set = json.load(f)
         except Exception as e:
-            logger.error(f'导入文件失败:{e}')
+            logger.error('导入文件失败:%s', e)
             sys.exit()
         logger.info('导入JSON文件完毕.')
     else:
-        logger.debug(f'JSON文件:{_JSON_PATH}不存在，自动创建中')
+        logger.debug('JSON文件:%s不存在，自动创建中', _JSON_PATH)
         try:
             with open(_JSON_PATH, 'w') as f:
                 json.dump(_EXT_TYPE_SET, f, indent=2)
         except Exception as e:
-            logger.error(f'文件写入失败:{e}')
+            logger.error('文件写入失败:%s', e)
             sys.exit()
         ext_type_set = _EXT_TYPE_SET
-        logger.info(f'自动生成JSON文件{_JSON_PATH}完毕.')
+        logger.info('自动生成JSON文件%s完毕.', _JSON_PATH)
 
-    main(args.dir)
+    main(args.dir, args.fmt)
 
-    logger.debug(f'正在保存JSON文件:{_JSON_PATH}')
+    logger.debug('正在保存JSON文件:%s', _JSON_PATH)
     try:
         with open(_JSON_PATH, 'w') as f:
             json.dump(ext_type_set, f, indent=2)
     except Exception as e:
-        logger.error(f'文件写入失败:{e}')
+        logger.error('文件写入失败:%s', e)
         sys.exit()
     logger.info('保存JSON文件完毕.')
@@ -9,6 +9,8 @@ tidy.py
 
 # 导入python内建模块
 import logging            # 日志模块
+import logging.handlers   # 日志队列处理器模块
+import queue              # 队列模块
 import os                 # 系统模块
 import sys                # 系统模块
 import shutil             # 文件操作模块
@@ -16,10 +18,17 @@ import time               # 时间模块
 import re                 # 正则模块
 import json               # JSON模块
 import argparse           # 命令行参数模块
+import atexit              # 退出钩子模块(退出前停止日志监听线程)
+from concurrent.futures import ThreadPoolExecutor, as_completed   # 线程池模块
 
 # 导入python第三方模块
 import pandas             # Pandas表格数据分析模块
+import openpyxl           # XLSX文件读写模块
 from tqdm import tqdm     # 进度条模块
+try:
+    import pyarrow.parquet    # Parquet读取引擎(可选，按批流式读取结果文件)
+except ImportError:
+    pyarrow = None
 
 # 定义媒体文件类别
 _FILE_TYPE = ['image', 'video', 'other']
@@ -39,13 +48,22 @@ _EXT_TYPE_SET = {
 # 定义日期检验类型
 _CHK_TYPE  = ['BOTH', 'META', 'EXIF', 'D_ERR', 'Y_ERR']
 
+# 程序启动时的年份，建目录的年份上限只需取一次
+_CURRENT_YEAR = time.localtime().tm_year
+
 # 定义EXIF标签日期项序列
 _EXIF_KEYS = ['EXIF DateTimeOriginal', 'EXIF DateTimeDigitized', 'Image DateTime']
 _META_KEYS = ['Date-time original',    'Date-time digitized',    'Creation date' ]
 
-# 定义JSON和XLSX文件路径
-_JSON_PATH   = r'ext_type_set.json'
-_XLSX_PATH   = r'result_df.xlsx'
+# 定义日期项到置信度字母的映射(U/H/N按可信度降序)及其排序等级
+_EXIF_CONFI = {_EXIF_KEYS[0]: 'U', _EXIF_KEYS[1]: 'H', _EXIF_KEYS[2]: 'N'}
+_META_CONFI = {_META_KEYS[0]: 'U', _META_KEYS[1]: 'H', _META_KEYS[2]: 'N'}
+_CONFI_RANK = {'U': 0, 'H': 1, 'N': 2, None: 3}
+
+# 定义JSON和XLSX、Parquet文件路径
+_JSON_PATH    = r'ext_type_set.json'
+_XLSX_PATH    = r'result_df.xlsx'
+_PARQUET_PATH = r'result_df.parquet'
 _D_XLSX_PATH = r'duplicated_df.xlsx'
 _Y_XLSX_PATH = r'year_err_df.xlsx'
 _F_XLSX_PATH = r'failed_files_df.xlsx'
@@ -75,7 +93,11 @@ for key in _FILE_CATEGORY.keys():
         if not t_dir in _DATE_DIRS:
             _DATE_DIRS.append(t_dir)
 
+# 预计算各类别的本地化目录路径，避免热循环内逐行split/join
+_CATEGORY_DIR = {key: value.replace('/', os.sep) for key, value in _FILE_CATEGORY.items()}
+
 # 初始化日志模块，建立3个日志器，2个文件日志，1个命令行日志。
+# 记录经QueueHandler入队后由后台QueueListener分发给3个处理器，热循环中只需一次入队
 _LOG_NAME       = 'Tidy'
 _DEBUG_LOG_PATH = r'logs\Tidy_Debug.log'
 _ERROR_LOG_PATH = r'logs\Tidy_Error.log'
@@ -94,9 +116,13 @@ formatter = logging.Formatter(
 fh_debug.setFormatter(formatter)
 fh_error.setFormatter(formatter)
 ch.setFormatter(formatter)
-logger.addHandler(fh_debug)
-logger.addHandler(fh_error)
-logger.addHandler(ch)
+_log_queue    = queue.Queue(-1)
+_log_listener = logging.handlers.QueueListener(_log_queue, fh_debug, fh_error, ch,
+                                               respect_handler_level=True)
+_log_listener.start()
+# 解释器退出时停止监听线程，否则队列里未分发的末尾记录会被静默丢弃
+atexit.register(_log_listener.stop)
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
 
 
 def mk_category_dirs(file_category):
@@ -105,13 +131,12 @@ def mk_category_dirs(file_category):
     参数    file_category:   已定义好的分类目录字典
     '''
     for category in file_category.values():
-        directory = os.path.join(*category.split('/'))
-        if not os.path.exists(directory):
-            os.mkdir(directory)
-            logger.debug(f'目录{directory}已创建')
-        else:
-            logger.debug(f'目录{directory}已存在')
-    logger.info(f'分类目录创建完毕')
+        directory = category.replace('/', os.sep)
+        # makedirs+exist_ok一次系统调用完成建目录，免去exists预检查
+        os.makedirs(directory, exist_ok=True)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('目录%s已就绪', directory)
+    logger.info('分类目录创建完毕')
 
 
 def mk_date_dirs(date_dirs, begin_year=2000):
@@ -121,24 +146,15 @@ def mk_date_dirs(date_dirs, begin_year=2000):
     参数   begin_year:  初始年份，默认为2000年
     '''
     for date_dir in date_dirs:
-        date_directory = os.path.join(*date_dir.split('/'))
-        for i in range(begin_year, time.localtime().tm_year + 1):
-            directory = os.path.join(date_directory, f'{i}')
-            if not os.path.exists(directory):
-                os.mkdir(directory)
-                logger.info(f'年目录{directory}已创建')
-            else:
-                logger.info(f'年目录{directory}已存在')
+        date_directory = date_dir.replace('/', os.sep)
+        for i in range(begin_year, _CURRENT_YEAR + 1):
             for j in range(1, 13):
-                directory = os.path.join(date_directory, f'{i}', f'{j:02}')
-                if not os.path.exists(directory):
-                    os.mkdir(directory)
-                    logger.debug(f'月目录{directory}已创建')
-                else:
-                    logger.debug(f'月目录{directory}已存在')
-            logger.debug(f'{i}年全年目录已创建')
-        logger.debug(f'{date_dir}下的年月子目录已创建')
-    logger.info(f'所有年月子目录已创建')
+                # makedirs递归创建年/月目录，exist_ok免去逐级exists预检查
+                os.makedirs(os.path.join(date_directory, f'{i}', f'{j:02}'), exist_ok=True)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('%s年全年目录已就绪', i)
+        logger.debug('%s下的年月子目录已创建', date_dir)
+    logger.info('所有年月子目录已创建')
 
 
 def rm_date_dirs(date_dirs, begin_year=2000):
@@ -150,101 +166,209 @@ def rm_date_dirs(date_dirs, begin_year=2000):
     print('正在删除空白年月目录')
     # os.removedirs区别
     for date_dir in date_dirs:
-        date_directory = os.path.join(*date_dir.split('/'))
-        for i in range(begin_year, time.localtime().tm_year + 1):
-            for j in range(1, 13):
-                directory = os.path.join(date_dir, f'{i}', f'{j:02}')
-                if not os.listdir(directory):
-                    os.rmdir(directory)
-                    logger.debug(f'空的月目录{directory}已删除')
-            logger.debug(f'{i}年空的月目录已删除')
-        logger.debug(f'所有空的月目录已删除')
-        for i in range(begin_year, time.localtime().tm_year + 1):
-            directory = os.path.join(date_dir, f'{i}')
-            if not os.listdir(directory):
-                os.rmdir(directory)
-                logger.debug(f'空的年目录{directory}已删除')
-        logger.debug(f'{date_dir}下空的年目录已删除')
-    logger.info(f'所有空的年月子目录已删除')
+        date_directory = date_dir.replace('/', os.sep)
+        # 每个年目录只做一次scandir，复用DirEntry免去逐月拼路径再listdir
+        with os.scandir(date_directory) as year_entries:
+            year_dirs = [entry for entry in year_entries if entry.is_dir()]
+        for year_entry in year_dirs:
+            with os.scandir(year_entry.path) as month_entries:
+                month_dirs = [entry for entry in month_entries if entry.is_dir()]
+            for month_entry in month_dirs:
+                if not os.listdir(month_entry.path):
+                    os.rmdir(month_entry.path)
+                    logger.debug('空的月目录%s已删除', month_entry.path)
+            if not os.listdir(year_entry.path):
+                os.rmdir(year_entry.path)
+                logger.debug('空的年目录%s已删除', year_entry.path)
+        logger.debug('%s下空的年目录已删除', date_dir)
+    logger.info('所有空的年月子目录已删除')
+
+
+def iter_xlsx_chunks(path, chunksize=10000):
+    '''
+    该函数以read_only模式流式读取XLSX文件，按chunksize分块产出DataFrame表
+    任意时刻内存中最多只有一个分块的行数据，输入行数不再受内存限制
+    参数   path:        XLSX文件路径
+    参数   chunksize:   每个分块的行数，默认10000行
+    '''
+    workbook  = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    worksheet = workbook.active
+    rows      = worksheet.iter_rows(values_only=True)
+    header    = list(next(rows))
+    width     = len(header)
+    chunk = []
+    for row in rows:
+        # read_only模式会省略行尾的空单元格，行宽不足时补齐None
+        if len(row) < width:
+            row = row + (None,) * (width - len(row))
+        chunk.append(row)
+        if len(chunk) >= chunksize:
+            yield pandas.DataFrame(chunk, columns=header)
+            chunk = []
+    if chunk:
+        yield pandas.DataFrame(chunk, columns=header)
+    workbook.close()
+
+
+def iter_result_chunks(parquet_path=_PARQUET_PATH, xlsx_path=_XLSX_PATH, chunksize=10000):
+    '''
+    该函数按分块产出结果文件的DataFrame表，优先Parquet，不存在时回退XLSX
+    参数   parquet_path:  Parquet结果文件路径
+    参数   xlsx_path:     XLSX结果文件路径
+    参数   chunksize:     每个分块的行数，默认10000行
+    '''
+    if pyarrow and os.path.exists(parquet_path):
+        # 按批读取行组，任一时刻内存中只有一个批次，不把整表载入
+        parquet_file = pyarrow.parquet.ParquetFile(parquet_path)
+        for batch in parquet_file.iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    elif os.path.exists(xlsx_path):
+        yield from iter_xlsx_chunks(xlsx_path, chunksize)
+    elif os.path.exists(parquet_path):
+        logger.error('未安装pyarrow，无法读取Parquet结果文件，退出程序')
+        sys.exit()
+    else:
+        logger.error('结果文件不存在,退出程序')
+        sys.exit()
+
+
+def stream_to_xlsx(rows, cols, path, sheet_name):
+    '''
+    该函数以openpyxl的write_only模式流式写入XLSX文件，逐行追加
+    行数据直接写入压缩流，不在内存中构建整个工作簿，内存占用与行数无关
+    参数    rows:         需要写入的行数据，可迭代
+    参数    cols:         字段（列首）列表
+    参数    path:         XLSX文件路径
+    参数    sheet_name:   工作表名
+    '''
+    logger.info('开始写入XLSX文件:%s...', path)
+    workbook  = openpyxl.Workbook(write_only=True)
+    worksheet = workbook.create_sheet(sheet_name)
+    worksheet.append(cols)
+    for row in rows:
+        # 缺失值(pandas.NA/NaN)openpyxl无法序列化，逐格换成None写出空单元格
+        worksheet.append([None if pandas.isna(value) else value for value in row])
+    workbook.save(path)
+    logger.info('写入XLSX文件完毕')
 
 
 def chk_cols(file_dataframe, cols_set):
-    if list(file_dataframe.columns)[1:] == cols_set:
+    # XLSX读入时首列是索引列，Parquet读入时没有，两种都视为匹配
+    cols = list(file_dataframe.columns)
+    if cols == cols_set or cols[1:] == cols_set:
         return True
     else:
-        logger.error(f'文件格式不匹配, 列索引错误:\n{list(file_dataframe.columns)}不符合{cols_set}')
-        return False 
+        logger.error('文件格式不匹配, 列索引错误:\n%s不符合%s', cols, cols_set)
+        return False
 
 
 def count_nums(file_dataframe):
     record = {}
     record['total'] = len(file_dataframe)
+    # 每列只做一次value_counts(C层单遍哈希统计)，避免逐个类别转list再count的重复扫描
+    type_vc = file_dataframe['文件类型'].value_counts()
+    ext_vc  = file_dataframe['扩展名'].value_counts()
+    chk_vc  = file_dataframe['日期校验'].value_counts()
+    exif_vc = file_dataframe['EXIF日期项'].value_counts()
+    meta_vc = file_dataframe['META日期项'].value_counts()
     sp = ''
     print('\n')
     print(     '┌─────────────────────────[解析结果]────────────────────────────┐')
     print(    f"│{sp:<15}共解析文件记录..................{record['total']:>6}条{sp:<8}│")
     print(     '├──────────────────────────文件类型─────────────────────────────┤')
     for file_type in _FILE_TYPE:
-        record[file_type] = list(file_dataframe['文件类型']).count(file_type)
+        record[file_type] = int(type_vc.get(file_type, 0))
         print(f"│{sp:<15}{file_type:<10}文件记录..............{record[file_type]:>6}条{sp:<8}│")
     print(     '├──────────────────────────扩展类型─────────────────────────────┤')
     for ext in ext_type_set.keys():
-        record[ext]       = list(file_dataframe['扩展名']).count(ext)
+        record[ext]       = int(ext_vc.get(ext, 0))
         print(f"│{sp:<15}{ext:<10}文件记录..............{record[ext]:>6}条{sp:<8}│")
     print(     '├──────────────────────────日期解析─────────────────────────────┤')
     for info_type in _CHK_TYPE:
-        record[info_type] = list(file_dataframe['日期校验']).count(info_type)
+        record[info_type] = int(chk_vc.get(info_type, 0))
         print(f"│{sp:<15}{info_type:<10}文件记录..............{record[info_type]:>6}条{sp:<8}│")
     print(     '├──────────────────────────EXIF标签─────────────────────────────┤')
     for exif_key in _EXIF_KEYS:
-        record[exif_key] = list(file_dataframe['EXIF日期项']).count(exif_key)
+        record[exif_key] = int(exif_vc.get(exif_key, 0))
         print(f"│{sp:<2}{exif_key:<23}文件记录..............{record[exif_key]:>6}条{sp:<8}│")
     print(     '├──────────────────────────META标签─────────────────────────────┤')
     for meta_key in _META_KEYS:
-        record[meta_key] = list(file_dataframe['META日期项']).count(meta_key)
+        record[meta_key] = int(meta_vc.get(meta_key, 0))
         print(f"│{sp:<2}{meta_key:<23}文件记录..............{record[meta_key]:>6}条{sp:<8}│")
     print(     '└───────────────────────────────────────────────────────────────┘')
     return record
 
 
-def chk_duplicate(file_dataframe, duplicated_keys=_D_COLS_SET):
+def chk_duplicate(d_df):
     '''
-    该函数负责查找和去除重复文件
-    参数    file_dataframe:  含有文件信息的DataFrame表, 列首为_COLS_SET
-    参数    duplicated_keys: 需要匹配的去重列内容, 默认为_D_COLS_SET
-    返回值: 
+    该函数展示重复文件记录，导出电子表格并询问用户是否去重
+    参数    d_df:   所有含重复键的文件记录DataFrame表
+    返回值:         用户确认去重为True，保留为False
     '''
-    d_df = file_dataframe[file_dataframe.duplicated(duplicated_keys, keep=False)]
     d_df = d_df.loc[:, ~d_df.columns.str.contains('^Unnamed')]
     print(d_df)
-    d_df.to_excel(_D_XLSX_PATH, sheet_name='重名文件')
+    stream_to_xlsx(d_df.itertuples(index=False, name=None), list(d_df.columns),
+                   _D_XLSX_PATH, '重名文件')
     print(f'以上电子表格已导出，详见{_D_XLSX_PATH}')
     sel = input("请确认是否去除重复文件(方法:保留重复的前项，删除后项):(YES/NO/EXIT):")
     while sel not in ['YES', 'NO', 'EXIT']:
         sel = input("输入不正确，请确认是否删除以上重复项:(YES/NO/EXIT):")
     if  sel == 'YES':
         logger.info('用户确认去除重复文件')
-        return file_dataframe.drop_duplicates(duplicated_keys)
+        return True
     elif sel == 'NO':
         logger.info('用户确认保留重复文件')
-        return file_dataframe
+        return False
     else:
         logger.info('用户在确认去重时选择退出')
         sys.exit()
-    
+
+
+# pick_num用到的正则预编译在模块级，热循环内不再走re缓存查找
+_RE_CN_EN    = re.compile(r'[\u4E00-\u9FA5A-Za-z]')
+_RE_LEAD_US  = re.compile(r'^_+')
+_RE_TAIL_US  = re.compile(r'_+$')
+_RE_MULTI_US = re.compile(r'___*')
+
 
 def pick_num(fname):
     '''
     该函数选取文件名中的首个数字到末尾数字的之间的部分，保留单独的下划线信息
     参数    fname:           需要挑选的文件名
     '''
-    result = re.sub(r'[\u4E00-\u9FA5A-Za-z]', '', fname) #去掉汉字和英文
-    result = re.sub(r'^_+', '', result)                  #去掉前边所有的下划线
-    result = re.sub(r'_+$', '', result)                  #去掉后边所有的下划线
-    result = re.sub(r'___*', '_', result)                #去掉中间多余的下划线
+    result = _RE_CN_EN.sub('', fname)        #去掉汉字和英文
+    result = _RE_LEAD_US.sub('', result)     #去掉前边所有的下划线
+    result = _RE_TAIL_US.sub('', result)     #去掉后边所有的下划线
+    result = _RE_MULTI_US.sub('_', result)   #去掉中间多余的下划线
     return result
 
 
+# os.copy_file_range在内核侧搬运数据，支持reflink的文件系统(Btrfs/XFS)上只建立元数据引用
+_HAS_COPY_RANGE = hasattr(os, 'copy_file_range')
+
+
+def _copy_file(input_path, output_path):
+    '''
+    该函数复制单个文件，优先走copy_file_range内核路径，失败时回退shutil.copyfile
+    参数    input_path:      原文件路径
+    参数    output_path:     目标文件路径
+    '''
+    if _HAS_COPY_RANGE:
+        try:
+            with open(input_path, 'rb') as src, open(output_path, 'wb') as dst:
+                remaining = os.fstat(src.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+                    if copied == 0:
+                        raise OSError(None, '源文件提前结束')
+                    remaining -= copied
+            return
+        except OSError:
+            # 跨设备或文件系统不支持时回退常规复制，'wb'重开会截断半成品
+            pass
+    shutil.copyfile(input_path, output_path)
+
+
 def move_file(input_path, output_path, remove=False):
     '''
     该函数负责移动或复制文件
@@ -254,12 +378,12 @@ def move_file(input_path, output_path, remove=False):
     返回值  reason           操作成功为None
     '''
     if not input_path:
-        logger.error(f'文件原始路径不存在:{input_path}')
+        logger.error('文件原始路径不存在:%s', input_path)
         reason = f'文件原始路径不存在:{input_path}'
         return reason
     output_dir = os.path.split(output_path)[0]
     if not os.path.exists(output_dir) and output_dir :
-        logger.error(f'文件目标路径目录不存在:{output_dir}')
+        logger.error('文件目标路径目录不存在:%s', output_dir)
         reason = f'文件目标路径目录不存在:{output_dir}'
         return reason
     if remove:
@@ -267,18 +391,18 @@ def move_file(input_path, output_path, remove=False):
         try:
             shutil.move(input_path, output_path)
         except Exception as e:
-            logger.error(f'移动文件错误:{e}')
+            logger.error('移动文件错误:%s', e)
             reason = f'移动文件错误:{e}'
             return reason
     else:
         move_mod = '复制文件'
         try:
-            shutil.copyfile(input_path, output_path)
+            _copy_file(input_path, output_path)
         except Exception as e:
-            logger.error(f'复制文件错误:{e}')
+            logger.error('复制文件错误:%s', e)
             reason = f'复制文件错误:{e}'
             return reason
-    logger.info(f'[{move_mod}]{input_path}至{output_path}')
+    logger.info('[%s]%s至%s', move_mod, input_path, output_path)
     return None
 
 # ['文件路径', '文件类型', '扩展名', '文件大小', 'MD5值', '日期校验', 'EXIF日期项', 'EXIF原日期', 'EXIF短日期', 'EXIF长日期', 'META日期项', 'META原日期', 'META短日期', 'META长日期']
@@ -286,124 +410,123 @@ def move_file(input_path, output_path, remove=False):
 # 对于有datetime信息的媒体文件， 保存到指定目录的:短日期/IMG_长日期_信息类型_00001.扩展名，如:2017/03/IMG_20170313_181520_EXIF_00001.ext
 # 对于没有datetime信息的媒体文件，保存到指定目录下的IMG_(原文件名中首个数字到最后一个数字的部分)_NODT_00001.ext
 # 对于文件类型为other的，保存到指定目录的原文件名_00001.ext
+def _next_seq(target_dir, dir_counts):
+    '''
+    该函数生成目标目录内的下一个文件序号
+    规划阶段不移动文件，目录内容不变，序号以目录现有文件数为起点在内存中累加
+    参数    target_dir:   目标目录
+    参数    dir_counts:   各目录当前序号的计数字典
+    '''
+    if target_dir not in dir_counts:
+        # os.scandir惰性迭代目录项计数，不必像os.listdir那样构建整个文件名列表
+        with os.scandir(target_dir) as entries:
+            dir_counts[target_dir] = sum(1 for entry in entries)
+    dir_counts[target_dir] += 1
+    return dir_counts[target_dir]
+
+
 def reorgnize_file(file_dataframe, remove=False):
     '''
     该函数根据DataFrame表进行文件整理归档
+    先规划出所有文件的目标路径，再用线程池并行执行复制/移动
     参数    file_dataframe:   含有文件信息的DataFrame表, 列首为_COLS_SET
     参数    remove:           移动或复制选项，默认复制
     '''
     success = 0
     fail    = 0
-    confi =None   # 媒体文件日期置信度
     yerr_files   = []
     failed_files = []
+    move_tasks   = []   # 规划好的(源路径, 目标路径, 文件大小)
+    dir_counts   = {}
     files_total = len(file_dataframe)
-    logger.debug(f'共需要整理{files_total}个文件...')
+    logger.debug('共需要整理%s个文件...', files_total)
     print(f'开始整理文件，共需整理{files_total}个')
-    pbar = tqdm(total=files_total,ncols=80)
-    for file in file_dataframe.itertuples():
-        source_path = file.文件路径
-        file_basename = os.path.basename(source_path)
-        file_name     = os.path.splitext(file_basename)[0]
-        if file.日期校验 in ['BOTH', 'D_ERR', 'META', 'EXIF']:
-            target_key  = file.文件类型 + '_with_datetime'
-            if file.日期校验 == 'EXIF':
-                if   file.EXIF日期项 == _EXIF_KEYS[0]:
-                    confi = 'EXIF_U'
-                elif file.EXIF日期项 == _EXIF_KEYS[1]:
-                    confi = 'EXIF_H'
-                elif file.EXIF日期项 == _EXIF_KEYS[2]:
-                    confi = 'EXIF_N'
-                else:
-                    logger.error(f'{file}的EXIF日期项错误')
-                target_dir  = os.path.join(*_FILE_CATEGORY[target_key].split('/'), *file.EXIF短日期.split('/'))
-                target_path = os.path.join(target_dir, f'IMG_{file.EXIF长日期}_{confi}_{len(os.listdir(target_dir))+1:05}.{file.扩展名}')
-            if file.日期校验 == 'META':
-                if   file.META日期项 == _META_KEYS[0]:
-                    confi = 'META_U'
-                elif file.META日期项 == _META_KEYS[1]:
-                    confi = 'META_H'
-                elif file.META日期项 == _META_KEYS[2]:
-                    confi = 'META_N'
-                else:
-                    logger.error(f'{file}的META日期项错误')
-                target_dir  = os.path.join(*_FILE_CATEGORY[target_key].split('/'), *file.META短日期.split('/'))
-                target_path = os.path.join(target_dir, f'IMG_{file.META长日期}_{confi}_{len(os.listdir(target_dir))+1:05}.{file.扩展名}')
-            if file.日期校验 == 'BOTH':
-                if   file.EXIF日期项 == _EXIF_KEYS[0] or file.META日期项 == _META_KEYS[0]:
-                    confi = 'BOTH_U'
-                elif file.EXIF日期项 == _EXIF_KEYS[1] or file.META日期项 == _META_KEYS[1]:
-                    confi = 'BOTH_H'
-                elif file.EXIF日期项 == _EXIF_KEYS[2] or file.META日期项 == _META_KEYS[2]:
-                    confi = 'BOTH_N'
-                else:
-                    logger.error(f'{file}的日期项错误')
-                target_dir  = os.path.join(*_FILE_CATEGORY[target_key].split('/'), *file.EXIF短日期.split('/'))
-                target_path = os.path.join(target_dir, f'IMG_{file.EXIF长日期}_{confi}_{len(os.listdir(target_dir))+1:05}.{file.扩展名}')
-            if file.日期校验 == 'D_ERR':
-                chose = None
-                if   file.EXIF日期项 == _EXIF_KEYS[0] or file.META日期项 == _META_KEYS[0]:
-                    if file.EXIF日期项 == _EXIF_KEYS[0]:
-                        chose = 'EXIF'
-                    else:
-                        chose = 'META'
-                    confi = 'U'
-                elif file.EXIF日期项 == _EXIF_KEYS[1] or file.META日期项 == _META_KEYS[1]:
-                    if file.EXIF日期项 == _EXIF_KEYS[1]:
-                        chose = 'EXIF'
-                    else:
-                        chose = 'META'
-                    confi = 'H'
-                elif file.EXIF日期项 == _EXIF_KEYS[2] or file.META日期项 == _META_KEYS[2]:
-                    if file.EXIF日期项 == _EXIF_KEYS[2]:
-                        chose = 'EXIF'
-                    else:
-                        chose = 'META'
-                    confi = 'N'
-                else:
-                    logger.error(f'{file}的日期项错误')
-                confi = 'D_' + chose + '_' + confi
-                if   chose == 'EXIF':
-                    target_dir  = os.path.join(*_FILE_CATEGORY[target_key].split('/'), *file.EXIF短日期.split('/'))
-                    target_path = os.path.join(target_dir, f'IMG_{file.EXIF长日期}_{confi}_{len(os.listdir(target_dir))+1:05}.{file.扩展名}')
-                elif chose == 'META':
-                    target_dir  = os.path.join(*_FILE_CATEGORY[target_key].split('/'), *file.META短日期.split('/'))
-                    target_path = os.path.join(target_dir, f'IMG_{file.META长日期}_{confi}_{len(os.listdir(target_dir))+1:05}.{file.扩展名}')
-                else:
-                    logger.error(f'错误')
-        elif file.日期校验 == 'Y_ERR':
-            target_dir  = os.path.join(*_FILE_CATEGORY['year_err'].split('/'))
-            target_path = os.path.join(target_dir, f'{file_name}_{len(os.listdir(target_dir))+1:05}.{file.扩展名}')
-            yerr_file = [source_path, target_path, file.文件大小, file.EXIF日期项, file.EXIF长日期, file.META日期项, file.META长日期]
+    # 目标目录、置信度和文件名前缀按列向量化计算，循环内只剩序号分配与特殊行处理
+    # 校验/类型列先补空串，缺失值(pandas.NA)参与成员判断会抛TypeError
+    chk         = file_dataframe['日期校验'].fillna('')
+    ftype       = file_dataframe['文件类型'].fillna('')
+    with_dt     = chk.isin(['BOTH', 'D_ERR', 'META', 'EXIF'])
+    exif_letter = file_dataframe['EXIF日期项'].map(_EXIF_CONFI)
+    meta_letter = file_dataframe['META日期项'].map(_META_CONFI)
+    # 取两侧中可信度更高的一侧，同级优先EXIF
+    use_exif    = exif_letter.map(_CONFI_RANK).fillna(_CONFI_RANK[None]) \
+                  <= meta_letter.map(_CONFI_RANK).fillna(_CONFI_RANK[None])
+    # EXIF行取EXIF项、META行取META项，BOTH/D_ERR行取可信度更高的一侧
+    group_letter = exif_letter.where(chk == 'EXIF',
+                   meta_letter.where(chk == 'META',
+                   exif_letter.where(use_exif, meta_letter)))
+    bad_rows = with_dt & group_letter.isna()
+    if bad_rows.any():
+        for bad_path in file_dataframe['文件路径'][bad_rows]:
+            logger.error('%s的日期项错误', bad_path)
+    d_side = use_exif.map({True: 'EXIF', False: 'META'})
+    confi  = (chk + '_' + group_letter).where(chk != 'D_ERR',
+             'D_' + d_side + '_' + group_letter)
+    # EXIF/BOTH行按EXIF日期归档，META行及D_ERR选中META的行按META日期归档
+    by_exif      = chk.isin(['EXIF', 'BOTH']) | ((chk == 'D_ERR') & use_exif)
+    chosen_short = file_dataframe['EXIF短日期'].where(by_exif, file_dataframe['META短日期'])
+    chosen_long  = file_dataframe['EXIF长日期'].where(by_exif, file_dataframe['META长日期'])
+    cat_dt       = (ftype + '_with_datetime').map(_CATEGORY_DIR)
+    cat_nodt     = (ftype + '_without_datetime').map(_CATEGORY_DIR)
+    target_dirs  = cat_nodt.fillna(_CATEGORY_DIR['other'])
+    target_dirs  = target_dirs.mask(chk == 'Y_ERR', _CATEGORY_DIR['year_err'])
+    target_dirs  = target_dirs.mask(with_dt,
+                   cat_dt + os.sep + chosen_short.str.replace('/', os.sep, regex=False))
+    name_prefix  = 'IMG_' + chosen_long + '_' + confi + '_'
+    col_path      = file_dataframe['文件路径'].to_numpy()
+    col_type      = ftype.to_numpy()
+    col_ext       = file_dataframe['扩展名'].fillna('').to_numpy()
+    col_size      = file_dataframe['文件大小'].to_numpy()
+    col_chk       = chk.to_numpy()
+    col_exif_key  = file_dataframe['EXIF日期项'].to_numpy()
+    col_exif_long = file_dataframe['EXIF长日期'].to_numpy()
+    col_meta_key  = file_dataframe['META日期项'].to_numpy()
+    col_meta_long = file_dataframe['META长日期'].to_numpy()
+    arr_dir       = target_dirs.to_numpy()
+    arr_prefix    = name_prefix.to_numpy()
+    for i in range(files_total):
+        source_path = col_path[i]
+        target_dir  = arr_dir[i]
+        if col_chk[i] in ('BOTH', 'D_ERR', 'META', 'EXIF'):
+            target_path = os.path.join(target_dir, f'{arr_prefix[i]}{_next_seq(target_dir, dir_counts):05}.{col_ext[i]}')
+        elif col_chk[i] == 'Y_ERR':
+            file_name   = os.path.splitext(os.path.basename(source_path))[0]
+            target_path = os.path.join(target_dir, f'{file_name}_{_next_seq(target_dir, dir_counts):05}.{col_ext[i]}')
+            yerr_file = [source_path, target_path, col_size[i], col_exif_key[i], col_exif_long[i], col_meta_key[i], col_meta_long[i]]
             yerr_files.append(yerr_file)
-        elif not file.文件类型 == 'other':
-            target_key  = file.文件类型 + '_without_datetime'
-            target_dir  = os.path.join(*_FILE_CATEGORY[target_key].split('/'))
+        elif not col_type[i] == 'other':
+            file_name   = os.path.splitext(os.path.basename(source_path))[0]
             file_num    = pick_num(file_name)
-            target_path = os.path.join(target_dir, f'IMG_{file_num}_NODT_{len(os.listdir(target_dir))+1:05}.{file.扩展名}')
+            target_path = os.path.join(target_dir, f'IMG_{file_num}_NODT_{_next_seq(target_dir, dir_counts):05}.{col_ext[i]}')
         else:
-            target_dir  = os.path.join(*_FILE_CATEGORY['other'].split('/'))
-            target_path = os.path.join(target_dir, f'{file_name}_{len(os.listdir(target_dir))+1:05}.{file.扩展名}')
-        failed_reason = move_file(source_path, target_path, remove)
-        if not failed_reason:
-            success += 1
-        else:
-            fail    += 1
-            failed_file  = [source_path, target_path, remove, file.文件大小, failed_reason]
-            failed_files.append(failed_file)
-        pbar.update(1)
+            file_name   = os.path.splitext(os.path.basename(source_path))[0]
+            target_path = os.path.join(target_dir, f'{file_name}_{_next_seq(target_dir, dir_counts):05}.{col_ext[i]}')
+        move_tasks.append((source_path, target_path, col_size[i]))
+    # 文件复制/移动在内核侧执行且释放GIL，线程池并行提交可以打满磁盘队列深度
+    # miniters/mininterval合并刷新，小文件快速完成时进度条不再逐条重绘终端
+    pbar = tqdm(total=files_total, ncols=80,
+                miniters=max(1, files_total // 1000), mininterval=0.2)
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as executor:
+        future_tasks = {}
+        for source_path, target_path, file_size in move_tasks:
+            future = executor.submit(move_file, source_path, target_path, remove)
+            future_tasks[future] = (source_path, target_path, file_size)
+        for future in as_completed(future_tasks):
+            source_path, target_path, file_size = future_tasks[future]
+            failed_reason = future.result()
+            if not failed_reason:
+                success += 1
+            else:
+                fail    += 1
+                failed_file  = [source_path, target_path, remove, file_size, failed_reason]
+                failed_files.append(failed_file)
+            pbar.update(1)
     print(f'整理完毕，成功整理文件{success}个, 失败{fail}个，失败文件信息和原因稍后见{_F_XLSX_PATH}')
     if failed_files:
-        f_df = pandas.DataFrame(failed_files, columns=_F_COLS_SET)
-        logger.info('开始写入XLSX文件{_F_XLSX_PATH}...')
-        f_df.to_excel(_F_XLSX_PATH, sheet_name='整理失败的文件')
-        logger.info('写入XLSX文件完毕')
+        stream_to_xlsx(failed_files, _F_COLS_SET, _F_XLSX_PATH, '整理失败的文件')
     if yerr_files:
-        y_df = pandas.DataFrame(yerr_files, columns=_Y_COLS_SET)
-        logger.info('开始写入XLSX文件{_Y_XLSX_PATH}...')
-        y_path = os.path.join(*_FILE_CATEGORY['year_err'].split('/'), *_Y_XLSX_PATH.split('/'))
-        y_df.to_excel(y_path, sheet_name='年份明显错误的文件')
-        logger.info('写入XLSX文件完毕')
+        y_path = os.path.join(_CATEGORY_DIR['year_err'], _Y_XLSX_PATH)
+        stream_to_xlsx(yerr_files, _Y_COLS_SET, y_path, '年份明显错误的文件')
     pbar.close()
 
 def main(target_dir, remove=False):
@@ -414,21 +537,72 @@ def main(target_dir, remove=False):
     '''
     if not os.path.exists(target_dir):
         os.mkdir(target_dir)
-    if not os.path.exists(_XLSX_PATH):
-        logger.error('xlsx文件不存在,退出程序')
-        sys.exit()
-    logger.debug(f'开始读取XLSX文件')
-    file_dataframe  = pandas.read_excel(_XLSX_PATH)
-
-    if not chk_cols(file_dataframe, _COLS_SET):
-        sys.exit()
-    count_nums(file_dataframe)
-    chked_dataframe = chk_duplicate(file_dataframe)
+    # 结果文件按分块流式读取，全程不在内存中保留完整的结果表
+    # 第三遍读取发生在chdir之后，这里先固定结果文件的绝对路径
+    parquet_path = os.path.abspath(_PARQUET_PATH)
+    xlsx_path    = os.path.abspath(_XLSX_PATH)
+    # 第一遍:校验表头，只收集统计与查重所需的窄列
+    slim_cols   = ['文件类型', '扩展名', '文件大小', 'MD5值', '日期校验', 'EXIF日期项', 'META日期项']
+    slim_chunks = []
+    for chunk in iter_result_chunks(parquet_path, xlsx_path):
+        if not slim_chunks and not chk_cols(chunk, _COLS_SET):
+            sys.exit()
+        slim_chunks.append(chunk[slim_cols])
+    # 结果表可能为零行(没有可归档的文件)，照常打印空报表
+    if slim_chunks:
+        slim_df = pandas.concat(slim_chunks, ignore_index=True)
+    else:
+        slim_df = pandas.DataFrame(columns=slim_cols)
+    del slim_chunks
+    count_nums(slim_df)
+    # 先用MD5列做一次集合预筛:无碰撞则整个查重流程(分桶标记/导表/询问)直接跳过
+    md5_seen = set()
+    has_dup_candidate = False
+    for file_md5 in slim_df['MD5值'].to_numpy():
+        if file_md5 in md5_seen:
+            has_dup_candidate = True
+            break
+        md5_seen.add(file_md5)
+    del md5_seen
+    dedup      = False
+    drop_flags = None
+    if has_dup_candidate:
+        # 单遍哈希分桶标记重复键:一次遍历同时得到首现行与重复后项
+        # dup_flags含重复键的全部行，drop_flags仅含待删除的后项
+        seen       = {}
+        dup_flags  = [False] * len(slim_df)
+        drop_flags = [False] * len(slim_df)
+        for row in slim_df[_D_COLS_SET].itertuples(index=True, name=None):
+            idx, key = row[0], row[1:]
+            first = seen.setdefault(key, idx)
+            if first != idx:
+                dup_flags[first] = True
+                dup_flags[idx]   = True
+                drop_flags[idx]  = True
+    if drop_flags and any(dup_flags):
+        # 第二遍:按全局行号收集重复记录的完整行，交由用户确认
+        d_chunks = []
+        offset   = 0
+        for chunk in iter_result_chunks(parquet_path, xlsx_path):
+            flags = dup_flags[offset:offset+len(chunk)]
+            if any(flags):
+                d_chunks.append(chunk[flags])
+            offset += len(chunk)
+        d_df  = pandas.concat(d_chunks, ignore_index=True)
+        dedup = chk_duplicate(d_df)
     curdir = os.path.abspath(os.curdir)
     os.chdir(target_dir)
     mk_category_dirs(_FILE_CATEGORY)
     mk_date_dirs(_DATE_DIRS)
-    reorgnize_file(chked_dataframe, remove=False)
+    # 第三遍:逐分块归档，确认去重时跳过待删除的后项
+    offset = 0
+    for chunk in iter_result_chunks(parquet_path, xlsx_path):
+        chunk_len = len(chunk)
+        if dedup:
+            flags = drop_flags[offset:offset+chunk_len]
+            chunk = chunk[[not flag for flag in flags]]
+        offset += chunk_len
+        reorgnize_file(chunk, remove=False)
     rm_date_dirs(_DATE_DIRS)
     os.chdir(curdir)
 
@@ -441,18 +615,18 @@ if __name__ == '__main__':
     args = arg_parser.parse_args()
 
     if os.path.exists(_JSON_PATH):
-        logger.debug(f'正在导入JSON文件:{_JSON_PATH}')
+        logger.debug('正在导入JSON文件:%s', _JSON_PATH)
         try:
             with open(_JSON_PATH, 'r') as f:
                 ext_type_set = json.load(f)
         except Exception as e:
-            logger.error(f'导入文件失败:{e}')
+            logger.error('导入文件失败:%s', e)
             sys.exit()
         logger.info('导入JSON文件完毕.')
     else:
-        logger.debug(f'JSON文件:{_JSON_PATH}不存在，使用默认配置')
+        logger.debug('JSON文件:%s不存在，使用默认配置', _JSON_PATH)
         ext_type_set = _EXT_TYPE_SET
-        logger.info(f'已应用默认文件类型配置.')
+        logger.info('已应用默认文件类型配置.')
 
     main(args.out, args.remove)
 